@@ -1,11 +1,16 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
-from jose import JWTError, jwt
+import jwt
+from jwt import InvalidTokenError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import os
+import time
+import asyncio
 import hashlib
-import bcrypt
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError
+from cachetools import TTLCache
 from .database import db, USERS_COLLECTION
 from .models import UserResponse
 
@@ -13,10 +18,22 @@ from .models import UserResponse
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30 дней
+ACCESS_TOKEN_EXPIRE = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
 # HTTP Bearer для токенов
 security = HTTPBearer()
 
+# Кэш проверенных токенов: sha256(токен) -> (пользователь, время истечения токена).
+# Изменения пользователя (например, is_admin) применяются не позже чем через TTL.
+# Обращения к кэшу идут только из event loop, поэтому блокировка не нужна.
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+_user_cache = TTLCache(maxsize=10_000, ttl=USER_CACHE_TTL_SECONDS)
+
+# Новые пароли хешируются argon2id (параметры OWASP: 19 MiB, 2 итерации),
+# хеши bcrypt ($2a$/$2b$) старых пользователей по-прежнему проверяются
+_password_hasher = PasswordHasher(time_cost=2, memory_cost=19 * 1024, parallelism=1)
+BCRYPT_HASH_PREFIX = "$2"
+
 
 def _prepare_password_for_bcrypt(password: str) -> bytes:
     """Подготавливает пароль для bcrypt (bcrypt имеет ограничение 72 байта)"""
@@ -31,35 +48,45 @@ def _prepare_password_for_bcrypt(password: str) -> bytes:
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Проверяет пароль"""
+    """Проверяет пароль (argon2id или старый bcrypt-хеш)"""
+    if not hashed_password:
+        return False
+    
     try:
-        # hashed_password должен быть строкой в формате bcrypt
-        prepared_password = _prepare_password_for_bcrypt(plain_password)
-        # Декодируем хеш из строки в bytes
-        hashed_bytes = hashed_password.encode('utf-8')
-        # Проверяем пароль
-        return bcrypt.checkpw(prepared_password, hashed_bytes)
-    except Exception:
+        if hashed_password.startswith(BCRYPT_HASH_PREFIX):
+            # bcrypt нужен только для старых хешей, импортируем при первой проверке
+            import bcrypt
+            
+            prepared_password = _prepare_password_for_bcrypt(plain_password)
+            # Декодируем хеш из строки в bytes
+            hashed_bytes = hashed_password.encode('utf-8')
+            return bcrypt.checkpw(prepared_password, hashed_bytes)
+        
+        return _password_hasher.verify(hashed_password, plain_password)
+    except (VerificationError, ValueError, TypeError):
+        # Неверный пароль или повреждённый хеш (InvalidHashError - подкласс ValueError)
         return False
 
 
 def get_password_hash(password: str) -> str:
-    """Хеширует пароль"""
-    prepared_password = _prepare_password_for_bcrypt(password)
-    # Генерируем соль и хешируем пароль
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(prepared_password, salt)
-    # Возвращаем как строку
-    return hashed.decode('utf-8')
+    """Хеширует пароль (argon2id, без ограничения bcrypt в 72 байта)"""
+    return _password_hasher.hash(password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Проверяет пароль в отдельном потоке, чтобы хеширование не блокировало event loop"""
+    return await asyncio.to_thread(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Хеширует пароль в отдельном потоке, чтобы хеширование не блокировало event loop"""
+    return await asyncio.to_thread(get_password_hash, password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Создает JWT токен"""
     to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    expire = datetime.now(timezone.utc) + (expires_delta or ACCESS_TOKEN_EXPIRE)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
@@ -70,7 +97,7 @@ def verify_token(token: str) -> Optional[dict]:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
-    except JWTError:
+    except InvalidTokenError:
         return None
 
 
@@ -79,6 +106,16 @@ async def get_current_user(
 ) -> UserResponse:
     """Получает текущего пользователя из токена"""
     token = credentials.credentials
+    
+    # Сырой токен в кэше не храним
+    cache_key = hashlib.sha256(token.encode('utf-8')).digest()
+    cached = _user_cache.get(cache_key)
+    if cached is not None:
+        cached_user, token_expires_at = cached
+        if time.time() < token_expires_at:
+            return cached_user
+        _user_cache.pop(cache_key, None)
+    
     payload = verify_token(token)
     
     if payload is None:
@@ -97,7 +134,7 @@ async def get_current_user(
         )
     
     # Получаем пользователя из Firebase
-    user_doc = db.collection(USERS_COLLECTION).document(user_id).get()
+    user_doc = await db.collection(USERS_COLLECTION).document(user_id).get()
     if not user_doc.exists:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -106,12 +143,15 @@ async def get_current_user(
         )
     
     user_data = user_doc.to_dict()
-    return UserResponse(
+    # Данные пришли из нашей же базы, повторная валидация не нужна
+    user = UserResponse.model_construct(
         id=user_doc.id,
         phone=user_data.get("phone"),
         name=user_data.get("name"),
         is_admin=user_data.get("is_admin", False)
     )
+    _user_cache[cache_key] = (user, payload.get("exp", 0))
+    return user
 
 
 async def get_current_admin_user(
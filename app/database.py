@@ -1,8 +1,8 @@
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials, firestore_async
 import os
 import json
-from typing import Optional
+import asyncio
 
 
 # Инициализация Firebase
@@ -31,7 +31,8 @@ def init_firebase():
         
         firebase_admin.initialize_app(cred)
     
-    return firestore.client()
+    # Асинхронный клиент: запросы не блокируют event loop и не занимают потоки
+    return firestore_async.client()
 
 
 # Получаем экземпляр Firestore (инициализация при импорте модуля)
@@ -43,9 +44,31 @@ USERS_COLLECTION = "users"
 QUESTIONS_COLLECTION = "questions"
 EXAMS_COLLECTION = "exams"
 REPORTS_COLLECTION = "reports"
+USER_STATS_COLLECTION = "user_stats"  # Агрегированная статистика экзаменов по пользователям
+MIGRATIONS_COLLECTION = "migrations"  # Отметки о выполненных миграциях данных
 
 
-def get_collection(collection_name: str):
-    """Получить ссылку на коллекцию"""
-    return db.collection(collection_name)
+# Сколько документов запрашивать в одном BatchGetDocuments
+GET_ALL_CHUNK_SIZE = 300
 
+
+async def _get_all(refs) -> list:
+    """Читает документы одним BatchGetDocuments"""
+    return [doc async for doc in db.get_all(refs)]
+
+
+async def get_documents(collection_name: str, document_ids) -> dict:
+    """Получает несколько документов коллекции пакетными запросами (BatchGetDocuments)
+    
+    Пакеты по GET_ALL_CHUNK_SIZE документов читаются параллельно.
+    Возвращает {id: snapshot} только для существующих документов
+    """
+    collection_ref = db.collection(collection_name)
+    # dict.fromkeys убирает повторы, сохраняя порядок
+    refs = [collection_ref.document(doc_id) for doc_id in dict.fromkeys(document_ids)]
+    if not refs:
+        return {}
+    
+    chunks = [refs[i:i + GET_ALL_CHUNK_SIZE] for i in range(0, len(refs), GET_ALL_CHUNK_SIZE)]
+    results = await asyncio.gather(*(_get_all(chunk) for chunk in chunks))
+    return {doc.id: doc for docs in results for doc in docs if doc.exists}
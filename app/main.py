@@ -1,34 +1,61 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer
 import json
 import random
+import asyncio
+import hashlib
 import os
+import time
 from pathlib import Path
+from types import MappingProxyType
 from typing import List, Optional
 from datetime import datetime
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+from pydantic import TypeAdapter
 
-from .database import db, USERS_COLLECTION, QUESTIONS_COLLECTION, EXAMS_COLLECTION, REPORTS_COLLECTION
+from .database import (
+    db, get_documents,
+    USERS_COLLECTION, QUESTIONS_COLLECTION, EXAMS_COLLECTION, REPORTS_COLLECTION, USER_STATS_COLLECTION,
+    MIGRATIONS_COLLECTION
+)
 from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
 from .models import (
     UserRegister, UserLogin, UserResponse, TokenResponse,
-    QuestionCreate, QuestionUpdate, QuestionResponse, QuestionFilter,
-    ExamSubmit, ExamResult, ExamHistoryResponse,
+    QuestionCreate, QuestionUpdate, QuestionResponse,
+    ExamSubmit, ExamResult, ExamHistoryResponse, ExamDetailsResponse,
     ReportCreate,
-    LegislationSection, TestMode, LEGISLATION_NAMES,
-    AdminQuestion, PaginatedResponse,
-    AdminQuestion, PaginatedResponse
+    LegislationSection, TestMode, LEGISLATION_NAMES, LEGISLATION_NAMES_BY_VALUE,
+    AdminQuestion, PaginatedResponse, normalize_phone
 )
 from .auth import (
-    get_password_hash, verify_password, create_access_token,
+    get_password_hash_async, verify_password_async, create_access_token,
     get_current_user, get_current_admin_user
 )
 from .middleware import TokenAuthMiddleware
 
 load_dotenv()
 
-app = FastAPI(title="Lawyer Test API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Прогревает статические данные при старте, чтобы запросы их не загружали"""
+    await load_translations_json()
+    try:
+        await load_questions()
+    except Exception as e:
+        # Вопросы загрузятся при первом запросе
+        print(f"⚠️  Не удалось загрузить вопросы при старте: {e!r}")
+    try:
+        await ensure_user_phone_keys()
+    except Exception as e:
+        # Миграция повторится при первой регистрации или входе
+        print(f"⚠️  Не удалось заполнить phone_key пользователей при старте: {e!r}")
+    yield
+
+
+app = FastAPI(title="Lawyer Test API", lifespan=lifespan)
 
 # CORS middleware
 frontend_url = os.getenv("FRONTEND_URL", "http://localhost:3000")
@@ -40,7 +67,8 @@ allowed_origins = [
 if frontend_url and frontend_url not in allowed_origins:
     allowed_origins.append(frontend_url)
 
-origin_regex = r"https://.*\.vercel\.app"
+# Поддомены *.vercel.app (Starlette сравнивает через fullmatch)
+origin_regex = r"https://[a-zA-Z0-9-]+(?:\.[a-zA-Z0-9-]+)*\.vercel\.app"
 
 app.add_middleware(
     CORSMiddleware,
@@ -60,10 +88,13 @@ if SECRET_LOCAL_TOKEN:
 TRANSLATIONS_PATH = Path(__file__).parent / "translations.json"
 TRANSLATIONS_COLLECTION = "translations"
 
+# Языки, на которых хранятся вопросы
+QUESTION_LANGUAGES = ("kz", "ru")
+
 
 _translations_cache = None
 
-def load_translations() -> dict:
+async def load_translations() -> dict:
     """Загружает переводы из Firebase или из JSON файла (fallback)"""
     global _translations_cache
     
@@ -74,7 +105,7 @@ def load_translations() -> dict:
     try:
         # Пытаемся загрузить из Firebase
         translations_ref = db.collection(TRANSLATIONS_COLLECTION)
-        docs = translations_ref.get()
+        docs = await translations_ref.get()
         
         if docs:
             translations = {}
@@ -101,6 +132,73 @@ def load_translations() -> dict:
         raise FileNotFoundError(f"Файл переводов не найден: {TRANSLATIONS_PATH}")
 
 
+def dump_json(content) -> bytes:
+    """Сериализует данные в JSON так же, как это делает JSONResponse"""
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def json_etag(body: bytes) -> str:
+    """ETag для сериализованного ответа"""
+    return '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+
+
+def prepare_json_payload(content) -> dict:
+    """Сериализует статический ответ один раз и считает для него ETag"""
+    body = dump_json(content)
+    return {"json": body, "etag": json_etag(body)}
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверяет заголовок If-None-Match (список тегов, слабые теги W/ и *)"""
+    if not if_none_match:
+        return False
+    
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def cached_json_response(request: Request, payload: dict, cache_control: str) -> Response:
+    """Отдаёт заранее сериализованный JSON, на совпадающий ETag отвечает 304"""
+    headers = {"ETag": payload["etag"], "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), payload["etag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    return Response(content=payload["json"], media_type="application/json", headers=headers)
+
+
+# Переводы и разделы меняются только при перезапуске сервера: после часа клиент
+# может еще сутки показывать старую копию, пока перепроверяет ее по ETag
+STATIC_CACHE_CONTROL = "public, max-age=3600, stale-while-revalidate=86400"
+
+_translations_json_cache = None
+
+async def load_translations_json() -> dict:
+    """Возвращает заранее сериализованные ответы с переводами (по языкам и целиком)"""
+    global _translations_json_cache
+    
+    if _translations_json_cache is not None:
+        return _translations_json_cache
+    
+    translations = await load_translations()
+    _translations_json_cache = {
+        "all": prepare_json_payload(translations),
+        "by_lang": {
+            lang: prepare_json_payload({"lang": lang, "translations": lang_translations})
+            for lang, lang_translations in translations.items()
+        }
+    }
+    return _translations_json_cache
+
+
 # ==================== ПУБЛИЧНЫЕ ENDPOINTS ====================
 
 @app.get("/")
@@ -128,43 +226,126 @@ async def health_check():
 
 
 @app.get("/api/translations/{lang}")
-def get_translations(lang: str):
+async def get_translations(lang: str, request: Request):
     """Получить переводы для указанного языка (kz или ru)"""
-    translations = load_translations()
-    if lang not in translations:
+    translations_json = (await load_translations_json())["by_lang"]
+    if lang not in translations_json:
         lang = "kz"
-    return {"lang": lang, "translations": translations[lang]}
+    return cached_json_response(request, translations_json[lang], STATIC_CACHE_CONTROL)
 
 
 @app.get("/api/translations")
-def get_all_translations():
+async def get_all_translations(request: Request):
     """Получить все доступные переводы"""
-    translations = load_translations()
-    return translations
+    return cached_json_response(request, (await load_translations_json())["all"], STATIC_CACHE_CONTROL)
+
+
+# Список разделов статичен: сериализуем его один раз для каждого языка
+LEGISLATION_SECTIONS_JSON = {
+    lang: prepare_json_payload({
+        "sections": [
+            {"id": section.value, "name": LEGISLATION_NAMES[section][lang]}
+            for section in LegislationSection
+        ]
+    })
+    for lang in QUESTION_LANGUAGES
+}
 
 
 @app.get("/api/legislation-sections")
-def get_legislation_sections(lang: str = "kz"):
+async def get_legislation_sections(request: Request, lang: str = "kz"):
     """Получить список всех разделов законодательства"""
-    sections = []
-    for section in LegislationSection:
-        sections.append({
-            "id": section.value,
-            "name": LEGISLATION_NAMES[section][lang]
-        })
-    return {"sections": sections}
+    return cached_json_response(
+        request,
+        LEGISLATION_SECTIONS_JSON[resolve_question_language(lang)],
+        STATIC_CACHE_CONTROL
+    )
 
 
 # ==================== АВТОРИЗАЦИЯ ====================
 
+def user_phone_ref(phone: str):
+    """Ссылка на документ пользователя: id документа - нормализованный телефон"""
+    return db.collection(USERS_COLLECTION).document(phone)
+
+
+def phone_key_for(phone: Optional[str]) -> Optional[str]:
+    """Нормализованный телефон для поля phone_key (None, если номер некорректный)"""
+    try:
+        return normalize_phone(phone or "")
+    except ValueError:
+        return None
+
+
+# Сколько обновлений отправлять в одном WriteBatch (лимит Firestore - 500)
+PHONE_KEY_BATCH_SIZE = 400
+
+_user_phone_keys_ready = False
+_user_phone_keys_lock = asyncio.Lock()
+
+
+async def ensure_user_phone_keys():
+    """Заполняет phone_key у пользователей, созданных до перехода на id = телефон
+    
+    Старые записи хранят телефон в том виде, в каком его ввели ("8 777 000 11 22"),
+    поэтому регистрация и вход ищут совпадения по нормализованному phone_key.
+    Выполняется один раз: после завершения в коллекции migrations остается отметка
+    """
+    global _user_phone_keys_ready
+    
+    if _user_phone_keys_ready:
+        return
+    
+    async with _user_phone_keys_lock:
+        if _user_phone_keys_ready:
+            return
+        
+        marker_ref = db.collection(MIGRATIONS_COLLECTION).document("user_phone_keys")
+        if not (await marker_ref.get()).exists:
+            batch = db.batch()
+            pending = 0
+            updated = 0
+            users_query = db.collection(USERS_COLLECTION).select(["phone", "phone_key"])
+            async for user_doc in users_query.stream():
+                user_data = user_doc.to_dict()
+                if "phone_key" in user_data:
+                    continue
+                batch.update(user_doc.reference, {"phone_key": phone_key_for(user_data.get("phone"))})
+                pending += 1
+                updated += 1
+                if pending == PHONE_KEY_BATCH_SIZE:
+                    await batch.commit()
+                    batch = db.batch()
+                    pending = 0
+            if pending:
+                await batch.commit()
+            
+            await marker_ref.set({"completed_at": datetime.utcnow(), "updated": updated})
+            print(f"✅ phone_key заполнен у {updated} пользователей")
+        
+        _user_phone_keys_ready = True
+
+
+async def find_users_by_phone_key(phone: str) -> list:
+    """Все пользователи с этим нормализованным телефоном (старые и новые записи)"""
+    await ensure_user_phone_keys()
+    return await db.collection(USERS_COLLECTION).where("phone_key", "==", phone).limit(10).get()
+
+
 @app.post("/api/auth/register", response_model=TokenResponse)
 async def register(user_data: UserRegister):
     """Регистрация нового пользователя"""
-    # Проверяем, существует ли пользователь с таким телефоном
-    users_ref = db.collection(USERS_COLLECTION)
-    query = users_ref.where("phone", "==", user_data.phone).limit(1).get()
+    # Телефон уже нормализован моделью UserRegister
+    phone = user_data.phone
+    user_ref = user_phone_ref(phone)
     
-    if query:
+    # Поиск по phone_key находит и старые записи с тем же номером в другом написании.
+    # Проверка идет параллельно с хешированием пароля
+    existing_users, password_hash = await asyncio.gather(
+        find_users_by_phone_key(phone),
+        get_password_hash_async(user_data.password)
+    )
+    if existing_users:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Пользователь с таким телефоном уже существует"
@@ -172,15 +353,23 @@ async def register(user_data: UserRegister):
     
     # Создаем нового пользователя
     user_dict = {
-        "phone": user_data.phone,
-        "password_hash": get_password_hash(user_data.password),
+        "phone": phone,
+        "phone_key": phone,
+        "password_hash": password_hash,
         "name": user_data.name,
         "is_admin": False,
         "created_at": datetime.utcnow()
     }
     
-    doc_ref = db.collection(USERS_COLLECTION).add(user_dict)
-    user_id = doc_ref[1].id
+    # create() атомарно отклоняет повторную регистрацию того же телефона
+    try:
+        await user_ref.create(user_dict)
+    except AlreadyExists:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Пользователь с таким телефоном уже существует"
+        )
+    user_id = user_ref.id
     
     # Создаем токен
     access_token = create_access_token(data={"sub": user_id})
@@ -189,7 +378,7 @@ async def register(user_data: UserRegister):
         access_token=access_token,
         user=UserResponse(
             id=user_id,
-            phone=user_data.phone,
+            phone=phone,
             name=user_data.name,
             is_admin=False
         )
@@ -199,26 +388,30 @@ async def register(user_data: UserRegister):
 @app.post("/api/auth/login", response_model=TokenResponse)
 async def login(user_data: UserLogin):
     """Вход пользователя"""
-    # Ищем пользователя по телефону
-    users_ref = db.collection(USERS_COLLECTION)
-    query = users_ref.where("phone", "==", user_data.phone).limit(1).get()
+    # Ищем пользователя по телефону (id документа), затем среди старых пользователей
+    phone = user_data.phone
+    user_doc = await user_phone_ref(phone).get()
+    if not (
+        user_doc.exists
+        and await verify_password_async(user_data.password, user_doc.to_dict().get("password_hash"))
+    ):
+        # Старые записи с тем же номером в другом написании, у каждой свой пароль
+        user_doc = None
+        for candidate in await find_users_by_phone_key(phone):
+            if candidate.id == phone:
+                continue
+            if await verify_password_async(user_data.password, candidate.to_dict().get("password_hash")):
+                user_doc = candidate
+                break
     
-    if not query:
+    if user_doc is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный телефон или пароль"
         )
     
-    user_doc = query[0]
     user_data_dict = user_doc.to_dict()
     
-    # Проверяем пароль
-    if not verify_password(user_data.password, user_data_dict.get("password_hash")):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Неверный телефон или пароль"
-        )
-    
     # Создаем токен
     access_token = create_access_token(data={"sub": user_doc.id})
     
@@ -241,39 +434,152 @@ async def get_me(current_user: UserResponse = Depends(get_current_user)):
 
 # ==================== ВОПРОСЫ ====================
 
-def format_question_for_language(question_doc, lang: str) -> QuestionResponse:
-    """Форматирует вопрос из Firebase для указанного языка"""
-    question_data = question_doc.to_dict()
-    section = LegislationSection(question_data.get("section"))
+# Для разделов, которых нет в LegislationSection (старые данные в админке)
+_EMPTY_SECTION_NAME = MappingProxyType({"kz": "", "ru": ""})
+
+
+def resolve_question_language(lang: str) -> str:
+    """Возвращает язык вопросов (kz, если язык неизвестен)"""
+    return lang if lang in QUESTION_LANGUAGES else "kz"
+
+
+def format_question_dict(question_id: str, question_data: dict, lang: str) -> QuestionResponse:
+    """Форматирует данные вопроса (словарь из Firebase) для указанного языка"""
+    section_value = question_data.get("section")
+    section_name = LEGISLATION_NAMES_BY_VALUE[section_value]
     
     return QuestionResponse(
-        id=question_doc.id,
+        id=question_id,
         question=question_data["question"][lang],
         options=[opt[lang] for opt in question_data["options"]],
         correct=question_data["correct"],
         explanation=question_data["explanation"][lang],
-        section=section.value,
-        section_name=LEGISLATION_NAMES[section]
+        section=section_value,
+        section_name=section_name
     )
 
 
+def format_question_for_language(question_doc, lang: str) -> QuestionResponse:
+    """Форматирует вопрос из Firebase для указанного языка"""
+    return format_question_dict(question_doc.id, question_doc.to_dict(), lang)
+
+
+QUESTION_LIST_ADAPTER = TypeAdapter(List[QuestionResponse])
+
+# Кэш вопросов сбрасывается при изменениях в админке этого процесса,
+# а TTL ограничивает устаревание, если вопросы изменили через другой воркер
+QUESTIONS_CACHE_TTL_SECONDS = int(os.getenv("QUESTIONS_CACHE_TTL_SECONDS", "60"))
+
+_questions_cache = None
+_questions_cache_loaded_at = 0.0
+# Увеличивается при каждом сбросе, чтобы не сохранить результат загрузки,
+# начатой до изменения вопросов
+_questions_cache_version = 0
+_questions_cache_lock = asyncio.Lock()
+
+
+def _questions_cache_is_fresh() -> bool:
+    """Проверяет, что кэш вопросов загружен и еще не устарел"""
+    return (
+        _questions_cache is not None
+        and time.monotonic() - _questions_cache_loaded_at < QUESTIONS_CACHE_TTL_SECONDS
+    )
+
+
+def build_questions_cache(question_docs) -> dict:
+    """Форматирует документы вопросов и раскладывает их по языкам"""
+    formatted_by_lang = {lang: [] for lang in QUESTION_LANGUAGES}
+    for q in question_docs:
+        # to_dict() один раз на документ, а не для каждого языка
+        question_data = q.to_dict()
+        for lang in QUESTION_LANGUAGES:
+            # Некорректный документ (или его перевод) пропускается только для этого языка,
+            # а не ломает все публичные endpoints вопросов
+            try:
+                formatted_question = format_question_dict(q.id, question_data, lang)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"⚠️  Вопрос {q.id} пропущен для языка {lang}: некорректные данные ({e!r})")
+                continue
+            formatted_by_lang[lang].append(formatted_question)
+    
+    questions_cache = {}
+    for lang, formatted_questions in formatted_by_lang.items():
+        by_section = {}
+        for q in formatted_questions:
+            by_section.setdefault(q.section, []).append(q)
+        
+        # Готовый ответ для /api/questions без фильтров и его ETag
+        body = QUESTION_LIST_ADAPTER.dump_json(formatted_questions)
+        questions_cache[lang] = {
+            "questions": formatted_questions,
+            # Вопросы по разделам для фильтра section и тренажера
+            "by_section": by_section,
+            # Вопросы по ID для отдельных вопросов и деталей экзамена
+            "by_id": {q.id: q for q in formatted_questions},
+            "json": body,
+            "etag": json_etag(body),
+        }
+    return questions_cache
+
+
+async def load_questions() -> dict:
+    """Загружает вопросы из Firebase и форматирует их для каждого языка (с кэшем)"""
+    global _questions_cache, _questions_cache_loaded_at
+    
+    # Используем кэш, если он загружен и еще не устарел
+    if _questions_cache_is_fresh():
+        return _questions_cache
+    
+    # Одновременные запросы ждут одну загрузку, а не читают коллекцию каждый
+    async with _questions_cache_lock:
+        if _questions_cache_is_fresh():
+            return _questions_cache
+        
+        version = _questions_cache_version
+        question_docs = await db.collection(QUESTIONS_COLLECTION).get()
+        questions_cache = build_questions_cache(question_docs)
+        if version == _questions_cache_version:
+            _questions_cache = questions_cache
+            _questions_cache_loaded_at = time.monotonic()
+        return questions_cache
+
+
+def invalidate_questions_cache():
+    """Сбрасывает кэш вопросов (вызывается после изменений в админке)"""
+    global _questions_cache, _questions_cache_version
+    _questions_cache = None
+    _questions_cache_version += 1
+
+
+async def get_questions_cache_entry(lang: str) -> dict:
+    """Возвращает кэш вопросов для языка (kz, если язык неизвестен)"""
+    return (await load_questions())[resolve_question_language(lang)]
+
+
+async def get_formatted_questions(lang: str, section: Optional[LegislationSection] = None) -> List[QuestionResponse]:
+    """Возвращает отформатированные вопросы для языка (и раздела, если указан)"""
+    questions = await get_questions_cache_entry(lang)
+    if section:
+        return questions["by_section"].get(section.value, [])
+    return questions["questions"]
+
+
+# Вопросы меняются через админку: клиент хранит копию, но перепроверяет ее по ETag
+QUESTIONS_CACHE_CONTROL = "no-cache"
+
+
 @app.get("/api/questions", response_model=List[QuestionResponse])
 async def get_questions(
+    request: Request,
     section: Optional[LegislationSection] = None,
     lang: str = "kz",
     limit: Optional[int] = None
 ):
     """Получить вопросы (с фильтрацией по разделу)"""
-    questions_ref = db.collection(QUESTIONS_COLLECTION)
-    
-    if section:
-        query = questions_ref.where("section", "==", section.value)
-    else:
-        query = questions_ref
+    if not section and not limit:
+        return cached_json_response(request, await get_questions_cache_entry(lang), QUESTIONS_CACHE_CONTROL)
     
-    questions = query.get()
-    
-    formatted_questions = [format_question_for_language(q, lang) for q in questions]
+    formatted_questions = await get_formatted_questions(lang, section)
     
     if limit:
         formatted_questions = formatted_questions[:limit]
@@ -284,33 +590,19 @@ async def get_questions(
 @app.get("/api/questions/demo", response_model=List[QuestionResponse])
 async def get_demo_questions(lang: str = "kz"):
     """Получить 20 случайных вопросов для демо режима"""
-    questions_ref = db.collection(QUESTIONS_COLLECTION)
-    all_questions = questions_ref.get()
-    
-    if len(all_questions) == 0:
-        return []
+    all_questions = await get_formatted_questions(lang)
     
     # Выбираем случайные 20 вопросов
-    selected_questions = random.sample(all_questions, min(20, len(all_questions)))
-    
-    formatted_questions = [format_question_for_language(q, lang) for q in selected_questions]
-    return formatted_questions
+    return random.sample(all_questions, min(20, len(all_questions)))
 
 
 @app.get("/api/questions/exam", response_model=List[QuestionResponse])
 async def get_exam_questions(lang: str = "kz"):
     """Получить 100 случайных вопросов для экзамена"""
-    questions_ref = db.collection(QUESTIONS_COLLECTION)
-    all_questions = questions_ref.get()
-    
-    if len(all_questions) == 0:
-        return []
+    all_questions = await get_formatted_questions(lang)
     
     # Выбираем случайные 100 вопросов
-    selected_questions = random.sample(all_questions, min(100, len(all_questions)))
-    
-    formatted_questions = [format_question_for_language(q, lang) for q in selected_questions]
-    return formatted_questions
+    return random.sample(all_questions, min(100, len(all_questions)))
 
 
 @app.get("/api/questions/trainer", response_model=List[QuestionResponse])
@@ -319,18 +611,18 @@ async def get_trainer_questions(
     lang: str = "kz"
 ):
     """Получить вопросы для тренажера по конкретному разделу"""
-    questions_ref = db.collection(QUESTIONS_COLLECTION)
-    query = questions_ref.where("section", "==", section.value)
-    questions = query.get()
-    
-    formatted_questions = [format_question_for_language(q, lang) for q in questions]
-    return formatted_questions
+    return await get_formatted_questions(lang, section)
 
 
 @app.get("/api/questions/{question_id}", response_model=QuestionResponse)
 async def get_question(question_id: str, lang: str = "kz"):
     """Получить вопрос по ID"""
-    question_doc = db.collection(QUESTIONS_COLLECTION).document(question_id).get()
+    cached_question = (await get_questions_cache_entry(lang))["by_id"].get(question_id)
+    if cached_question is not None:
+        return cached_question
+    
+    # Вопрос мог появиться после загрузки кэша
+    question_doc = await db.collection(QUESTIONS_COLLECTION).document(question_id).get()
     
     if not question_doc.exists:
         raise HTTPException(
@@ -338,11 +630,75 @@ async def get_question(question_id: str, lang: str = "kz"):
             detail="Вопрос не найден"
         )
     
-    return format_question_for_language(question_doc, lang)
+    return format_question_for_language(question_doc, resolve_question_language(lang))
 
 
 # ==================== ЭКЗАМЕНЫ ====================
 
+def add_section_results(statistics: dict, section_results: dict):
+    """Добавляет результаты по разделам к статистике {section: {"correct": X, "total": Y}}"""
+    for section, stats in section_results.items():
+        if section not in statistics:
+            statistics[section] = {"correct": 0, "total": 0}
+        statistics[section]["correct"] += stats["correct"]
+        statistics[section]["total"] += stats["total"]
+
+
+def user_stats_increment(section_results: dict) -> dict:
+    """Обновление агрегированной статистики пользователя после одного экзамена
+    
+    Пустой словарь sections не передаем: при set(merge=True) он стал бы
+    значением поля и стер бы накопленную статистику по разделам
+    """
+    increment = {"total_exams": firestore.Increment(1)}
+    if section_results:
+        increment["sections"] = {
+            section: {
+                "correct": firestore.Increment(stats["correct"]),
+                "total": firestore.Increment(stats["total"]),
+            }
+            for section, stats in section_results.items()
+        }
+    return increment
+
+
+@firestore.async_transactional
+async def _backfill_user_stats(transaction, stats_ref, user_id: str) -> dict:
+    """Собирает статистику по всем экзаменам пользователя (для старых пользователей)
+    
+    Выполняется в транзакции: параллельные инкременты из submit_exam
+    дождутся ее завершения и применятся поверх результата
+    """
+    stats_doc = await stats_ref.get(transaction=transaction)
+    stats = stats_doc.to_dict() if stats_doc.exists else None
+    if stats and stats.get("backfilled"):
+        return stats
+    
+    exams_query = db.collection(EXAMS_COLLECTION).where("user_id", "==", user_id)
+    exam_docs = await exams_query.select(["section_results"]).get(transaction=transaction)
+    
+    sections = {}
+    for exam_doc in exam_docs:
+        add_section_results(sections, exam_doc.to_dict().get("section_results") or {})
+    
+    stats = {"total_exams": len(exam_docs), "sections": sections, "backfilled": True}
+    transaction.set(stats_ref, stats)
+    return stats
+
+
+async def load_user_stats(user_id: str) -> dict:
+    """Возвращает агрегированную статистику пользователя {"total_exams", "sections"}"""
+    stats_ref = db.collection(USER_STATS_COLLECTION).document(user_id)
+    stats_doc = await stats_ref.get()
+    if stats_doc.exists:
+        stats = stats_doc.to_dict()
+        if stats.get("backfilled"):
+            return stats
+    
+    # Статистика еще не собиралась по старым экзаменам
+    return await _backfill_user_stats(db.transaction(), stats_ref, user_id)
+
+
 @app.post("/api/exams/submit", response_model=ExamResult)
 async def submit_exam(
     exam_data: ExamSubmit,
@@ -350,16 +706,10 @@ async def submit_exam(
 ):
     """Отправить результаты экзамена"""
     try:
-        # Получаем вопросы для проверки ответов
-        questions_ref = db.collection(QUESTIONS_COLLECTION)
+        # Получаем вопросы для проверки ответов одним запросом
         question_ids = [ans.question_id for ans in exam_data.answers]
-        
-        # Получаем все вопросы
-        questions_dict = {}
-        for qid in question_ids:
-            q_doc = questions_ref.document(qid).get()
-            if q_doc.exists:
-                questions_dict[qid] = q_doc.to_dict()
+        question_docs = await get_documents(QUESTIONS_COLLECTION, question_ids)
+        questions_dict = {qid: q_doc.to_dict() for qid, q_doc in question_docs.items()}
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -412,8 +762,16 @@ async def submit_exam(
     }
     
     try:
-        doc_ref = db.collection(EXAMS_COLLECTION).add(exam_dict)
-        exam_id = doc_ref[1].id
+        # Экзамен и инкремент статистики записываются одним атомарным коммитом
+        exam_ref = db.collection(EXAMS_COLLECTION).document()
+        exam_id = exam_ref.id
+        batch = db.batch()
+        batch.set(exam_ref, exam_dict)
+        batch.set(
+            db.collection(USER_STATS_COLLECTION).document(current_user.id),
+            user_stats_increment(section_results), merge=True
+        )
+        await batch.commit()
         
         return ExamResult(
             id=exam_id,
@@ -437,29 +795,32 @@ async def submit_exam(
 
 @app.get("/api/exams/history", response_model=ExamHistoryResponse)
 async def get_exam_history(
+    page: int = 1,
+    page_size: Optional[int] = None,
     current_user: UserResponse = Depends(get_current_user)
 ):
-    """Получить историю экзаменов пользователя"""
+    """Получить историю экзаменов пользователя (от новых к старым, page_size - для пагинации)"""
+    if page < 1:
+        page = 1
+    
     exams_ref = db.collection(EXAMS_COLLECTION)
-    # Используем только where, без order_by, чтобы избежать требования индекса
-    # Сортировку делаем в Python
-    query = exams_ref.where("user_id", "==", current_user.id)
-    exams = query.get()
+    user_exams = exams_ref.where("user_id", "==", current_user.id)
     
-    exam_results = []
-    overall_statistics = {}  # {section: {"correct": X, "total": Y}}
+    # Сортировка и пагинация в Firestore (индекс user_id ASC, created_at DESC
+    # описан в firestore.indexes.json)
+    query = user_exams.order_by("created_at", direction=firestore.Query.DESCENDING)
+    if page_size and page_size > 0:
+        query = query.offset((page - 1) * page_size).limit(page_size)
+    # Страница экзаменов и общая статистика (хранится агрегированной в user_stats)
+    # не зависят друг от друга - запрашиваем параллельно
+    exams, user_stats = await asyncio.gather(
+        query.get(),
+        load_user_stats(current_user.id)
+    )
     
+    exam_results = []
     for exam_doc in exams:
         exam_data = exam_doc.to_dict()
-        
-        # Обновляем общую статистику
-        section_results = exam_data.get("section_results", {})
-        for section, stats in section_results.items():
-            if section not in overall_statistics:
-                overall_statistics[section] = {"correct": 0, "total": 0}
-            overall_statistics[section]["correct"] += stats["correct"]
-            overall_statistics[section]["total"] += stats["total"]
-        
         exam_results.append(ExamResult(
             id=exam_doc.id,
             user_id=exam_data["user_id"],
@@ -474,17 +835,14 @@ async def get_exam_history(
             created_at=exam_data["created_at"]
         ))
     
-    # Сортируем результаты по дате создания (от новых к старым)
-    exam_results.sort(key=lambda x: x.created_at, reverse=True)
-    
     return ExamHistoryResponse(
         exams=exam_results,
-        total_exams=len(exam_results),
-        overall_statistics=overall_statistics
+        total_exams=user_stats.get("total_exams", 0),
+        overall_statistics=user_stats.get("sections", {})
     )
 
 
-@app.get("/api/exams/{exam_id}")
+@app.get("/api/exams/{exam_id}", response_model=ExamDetailsResponse)
 async def get_exam_details(
     exam_id: str,
     lang: str = "kz",
@@ -492,7 +850,7 @@ async def get_exam_details(
 ):
     """Получить детали экзамена с вопросами и ответами"""
     try:
-        exam_doc = db.collection(EXAMS_COLLECTION).document(exam_id).get()
+        exam_doc = await db.collection(EXAMS_COLLECTION).document(exam_id).get()
         
         if not exam_doc.exists:
             raise HTTPException(
@@ -509,25 +867,32 @@ async def get_exam_details(
                 detail="Нет доступа к этому экзамену"
             )
         
-        # Получаем вопросы и ответы
-        questions_ref = db.collection(QUESTIONS_COLLECTION)
+        # Вопросы берем из кэша, недостающие - одним пакетным запросом
+        lang = resolve_question_language(lang)
         answers = exam_data.get("answers", [])
+        cached_questions = (await get_questions_cache_entry(lang))["by_id"]
+        question_docs = await get_documents(
+            QUESTIONS_COLLECTION,
+            [a["question_id"] for a in answers if a["question_id"] not in cached_questions]
+        )
         
         questions_with_answers = []
         for answer_data in answers:
             question_id = answer_data["question_id"]
             user_answer = answer_data["answer"]
             
-            question_doc = questions_ref.document(question_id).get()
-            if question_doc.exists:
-                question_dict = question_doc.to_dict()
+            formatted_question = cached_questions.get(question_id)
+            if formatted_question is None:
+                question_doc = question_docs.get(question_id)
+                if question_doc is None:
+                    continue
                 formatted_question = format_question_for_language(question_doc, lang)
-                
-                questions_with_answers.append({
-                    **formatted_question.dict(),
-                    "user_answer": user_answer,
-                    "is_correct": user_answer >= 0 and question_dict.get("correct") == user_answer,
-                })
+            
+            questions_with_answers.append({
+                **formatted_question.model_dump(),
+                "user_answer": user_answer,
+                "is_correct": user_answer >= 0 and formatted_question.correct == user_answer,
+            })
         
         return {
             "exam": {
@@ -569,7 +934,7 @@ async def create_report(
         "processed": False
     }
     
-    doc_ref = db.collection(REPORTS_COLLECTION).add(report_dict)
+    doc_ref = await db.collection(REPORTS_COLLECTION).add(report_dict)
     
     return {"id": doc_ref[1].id, "message": "Отчет создан"}
 
@@ -580,36 +945,51 @@ async def create_report(
 async def get_admin_questions(
     page: int = 1,
     page_size: int = 10,
+    cursor: Optional[str] = None,
     current_user: UserResponse = Depends(get_current_admin_user)
 ):
-    """Получить вопросы для админки в исходном формате (с kz/ru полями) с пагинацией"""
+    """Получить вопросы для админки в исходном формате (с kz/ru полями) с пагинацией
+    
+    cursor - id последнего вопроса предыдущей страницы (next_cursor из ответа):
+    с ним Firestore не перебирает пропущенные документы, как при offset
+    """
     if page < 1:
         page = 1
     if page_size < 1 or page_size > 100:
         page_size = 10
     
+    # Страница и общее количество считаются в Firestore, без загрузки всей коллекции
     questions_ref = db.collection(QUESTIONS_COLLECTION)
-    all_questions = questions_ref.get()
-    
-    # Получаем общее количество вопросов
-    total = len(all_questions)
+    query = questions_ref.order_by("__name__")
+    if cursor:
+        # cursor - id документа: с "/" document() упадет с ValueError,
+        # а зарезервированные и слишком длинные id отклонит Firestore
+        if (
+            "/" in cursor
+            or cursor in (".", "..")
+            or (cursor.startswith("__") and cursor.endswith("__"))
+            or len(cursor.encode("utf-8")) > 1500
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Некорректный курсор"
+            )
+        query = query.start_after({"__name__": questions_ref.document(cursor)})
+    else:
+        query = query.offset((page - 1) * page_size)
     
-    # Вычисляем индексы для среза
-    start_index = (page - 1) * page_size
-    end_index = start_index + page_size
+    page_docs, count_result = await asyncio.gather(
+        query.limit(page_size).get(),
+        questions_ref.count().get()
+    )
+    total = count_result[0][0].value
     
     # Форматируем только нужные вопросы
     questions = []
-    for q_doc in all_questions[start_index:end_index]:
+    for q_doc in page_docs:
         q_data = q_doc.to_dict()
         section_value = q_data.get("section", "")
-        section_name = {"kz": "", "ru": ""}
-        try:
-            if section_value:
-                section = LegislationSection(section_value)
-                section_name = LEGISLATION_NAMES.get(section, {"kz": "", "ru": ""})
-        except (ValueError, KeyError):
-            pass
+        section_name = LEGISLATION_NAMES_BY_VALUE.get(section_value, _EMPTY_SECTION_NAME)
         
         questions.append(AdminQuestion(
             id=q_doc.id,
@@ -621,15 +1001,12 @@ async def get_admin_questions(
             section_name=section_name
         ))
     
-    # Вычисляем общее количество страниц
-    total_pages = (total + page_size - 1) // page_size if total > 0 else 1
-    
-    return PaginatedResponse(
+    return PaginatedResponse.build(
         items=questions,
         total=total,
         page=page,
         page_size=page_size,
-        total_pages=total_pages
+        next_cursor=page_docs[-1].id if len(page_docs) == page_size else None
     )
 
 
@@ -640,21 +1017,16 @@ async def create_question(
     current_user: UserResponse = Depends(get_current_admin_user)
 ):
     """Создать новый вопрос (только для админов)"""
-    question_dict = {
-        "question": question_data.question.dict(),
-        "options": [opt.dict() for opt in question_data.options],
-        "correct": question_data.correct,
-        "explanation": question_data.explanation.dict(),
-        "section": question_data.section.value,
-        "created_at": datetime.utcnow()
-    }
+    # mode="json" сразу дает значение раздела строкой, как оно хранится в Firebase
+    question_dict = question_data.model_dump(mode="json")
+    question_dict["created_at"] = datetime.utcnow()
     
-    doc_ref = db.collection(QUESTIONS_COLLECTION).add(question_dict)
+    doc_ref = await db.collection(QUESTIONS_COLLECTION).add(question_dict)
     question_id = doc_ref[1].id
+    invalidate_questions_cache()
     
-    # Получаем созданный вопрос для возврата
-    question_doc = db.collection(QUESTIONS_COLLECTION).document(question_id).get()
-    return format_question_for_language(question_doc, lang)
+    # Ответ собираем из записанных данных, без повторного чтения
+    return format_question_dict(question_id, question_dict, lang)
 
 
 @app.put("/api/admin/questions/{question_id}", response_model=QuestionResponse)
@@ -666,7 +1038,7 @@ async def update_question(
 ):
     """Обновить вопрос (только для админов)"""
     question_ref = db.collection(QUESTIONS_COLLECTION).document(question_id)
-    question_doc = question_ref.get()
+    question_doc = await question_ref.get()
     
     if not question_doc.exists:
         raise HTTPException(
@@ -675,25 +1047,14 @@ async def update_question(
         )
     
     # Обновляем только переданные поля
-    update_dict = {}
-    if question_data.question:
-        update_dict["question"] = question_data.question.dict()
-    if question_data.options:
-        update_dict["options"] = [opt.dict() for opt in question_data.options]
-    if question_data.correct is not None:
-        update_dict["correct"] = question_data.correct
-    if question_data.explanation:
-        update_dict["explanation"] = question_data.explanation.dict()
-    if question_data.section:
-        update_dict["section"] = question_data.section.value
-    
+    update_dict = question_data.model_dump(mode="json", exclude_unset=True, exclude_none=True)
     update_dict["updated_at"] = datetime.utcnow()
     
-    question_ref.update(update_dict)
+    await question_ref.update(update_dict)
+    invalidate_questions_cache()
     
-    # Получаем обновленный вопрос
-    updated_doc = question_ref.get()
-    return format_question_for_language(updated_doc, lang)
+    # Обновленный вопрос = прочитанный документ + переданные поля
+    return format_question_dict(question_id, {**question_doc.to_dict(), **update_dict}, lang)
 
 
 @app.delete("/api/admin/questions/{question_id}")
@@ -703,7 +1064,7 @@ async def delete_question(
 ):
     """Удалить вопрос (только для админов)"""
     question_ref = db.collection(QUESTIONS_COLLECTION).document(question_id)
-    question_doc = question_ref.get()
+    question_doc = await question_ref.get()
     
     if not question_doc.exists:
         raise HTTPException(
@@ -711,5 +1072,6 @@ async def delete_question(
             detail="Вопрос не найден"
         )
     
-    question_ref.delete()
+    await question_ref.delete()
+    invalidate_questions_cache()
     return {"message": "Вопрос удален"}
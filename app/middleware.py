@@ -1,59 +1,84 @@
-from fastapi import Request, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import status
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+import hmac
 import os
+import re
 
 
 SECRET_LOCAL_TOKEN = os.getenv("SECRET_LOCAL_TOKEN")
+# Заголовки приходят в байтах, поэтому токен кодируем один раз при загрузке
+SECRET_LOCAL_TOKEN_BYTES = SECRET_LOCAL_TOKEN.encode("utf-8") if SECRET_LOCAL_TOKEN else None
 
+# Публичные endpoints (точное совпадение пути)
+PUBLIC_PATHS = ("/", "/docs", "/openapi.json", "/redoc")
+
+# Публичные API endpoints (не требуют токена), вместе с вложенными путями
+PUBLIC_API_PATHS = (
+    "/api/translations",
+    "/api/questions",
+    "/api/legislation-sections",
+    "/api/auth/register",
+    "/api/auth/login",
+)
+
+# Одна проверка регулярным выражением вместо перебора путей на каждый запрос
+_PUBLIC_PATH_RE = re.compile(
+    "(?:" + "|".join(re.escape(path) for path in PUBLIC_PATHS) + ")$"
+    "|(?:" + "|".join(re.escape(path) for path in PUBLIC_API_PATHS) + ")(?:/|$)"
+)
+
+
+class TokenAuthMiddleware:
+    """Middleware для проверки SECRET_LOCAL_TOKEN
+
+    Чистый ASGI: без BaseHTTPMiddleware, лишней задачи и объектов Request/Response на запрос
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
 
-class TokenAuthMiddleware(BaseHTTPMiddleware):
-    """Middleware для проверки SECRET_LOCAL_TOKEN"""
-    
-    async def dispatch(self, request: Request, call_next):
         # Пропускаем OPTIONS запросы (preflight для CORS)
-        if request.method == "OPTIONS":
-            return await call_next(request)
-        
+        if scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+
         # Пропускаем публичные endpoints
-        public_paths = ["/", "/docs", "/openapi.json", "/redoc"]
-        if request.url.path in public_paths:
-            return await call_next(request)
-        
-        # Публичные API endpoints (не требуют токена)
-        public_api_paths = [
-            "/api/translations",
-            "/api/questions",
-            "/api/legislation-sections",
-            "/api/auth/register",
-            "/api/auth/login",
-        ]
-        
-        # Проверяем, начинается ли путь с публичного пути
-        for public_path in public_api_paths:
-            if request.url.path.startswith(public_path):
-                return await call_next(request)
-        
+        path = scope["path"]
+        if _PUBLIC_PATH_RE.match(path):
+            return await self.app(scope, receive, send)
+
+        # Заголовки в scope - список пар байтов с именами в нижнем регистре
+        auth_header = None
+        token = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                auth_header = value
+            elif name == b"x-api-token":
+                token = value
+
         # Если есть Authorization заголовок (JWT токен), пропускаем проверку X-API-Token
         # JWT токены обрабатываются через get_current_user dependency
-        auth_header = request.headers.get("Authorization")
-        if auth_header and auth_header.startswith("Bearer "):
-            return await call_next(request)
-        
+        if auth_header and auth_header.startswith(b"Bearer "):
+            return await self.app(scope, receive, send)
+
         # Проверяем токен в заголовке X-API-Token (для прямых API запросов)
-        token = request.headers.get("X-API-Token")
-        
         if not token:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Токен API не предоставлен"
+            response = JSONResponse(
+                {"detail": "Токен API не предоставлен"},
+                status_code=status.HTTP_401_UNAUTHORIZED
             )
-        
-        if token != SECRET_LOCAL_TOKEN:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Неверный токен API"
+            return await response(scope, receive, send)
+
+        # Сравнение за постоянное время не раскрывает токен по времени ответа
+        if SECRET_LOCAL_TOKEN_BYTES is None or not hmac.compare_digest(token, SECRET_LOCAL_TOKEN_BYTES):
+            response = JSONResponse(
+                {"detail": "Неверный токен API"},
+                status_code=status.HTTP_401_UNAUTHORIZED
             )
-        
-        return await call_next(request)
+            return await response(scope, receive, send)
 
+        return await self.app(scope, receive, send)
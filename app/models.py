@@ -1,7 +1,9 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List, Dict
+from pydantic import BaseModel, Field, AfterValidator
+from typing import Optional, List, Dict, Annotated
 from datetime import datetime
 from enum import Enum
+from types import MappingProxyType
+import re
 
 
 class LegislationSection(str, Enum):
@@ -24,15 +26,37 @@ class TestMode(str, Enum):
     TRAINER = "trainer"  # Тренажер
 
 
+# Номер телефона после удаления маски ввода: необязательный "+" и 10-15 цифр
+PHONE_PATTERN = re.compile(r"\+?[0-9]{10,15}")
+# Символы, которые маска ввода ставит между цифрами
+PHONE_MASK_CHARS = str.maketrans("", "", " ()-.")
+
+
+def normalize_phone(phone: str) -> str:
+    """Приводит телефон к виду "+цифры" (или "цифры", если "+" не было)
+    
+    Удаляются только пробелы, скобки, дефисы и точки. Любые другие символы
+    делают номер некорректным. Результат всегда годится как id документа Firestore
+    """
+    normalized = phone.strip().translate(PHONE_MASK_CHARS)
+    if not PHONE_PATTERN.fullmatch(normalized):
+        raise ValueError("Некорректный номер телефона")
+    return normalized
+
+
+# Телефон проверяется и нормализуется одинаково при регистрации и входе
+PhoneNumber = Annotated[str, AfterValidator(normalize_phone)]
+
+
 # Модели для авторизации
 class UserRegister(BaseModel):
-    phone: str
+    phone: PhoneNumber
     password: str
     name: str
 
 
 class UserLogin(BaseModel):
-    phone: str
+    phone: PhoneNumber
     password: str
 
 
@@ -63,7 +87,7 @@ class QuestionText(BaseModel):
 class QuestionCreate(BaseModel):
     question: QuestionText
     options: List[QuestionOption]
-    correct: int  # 0-3
+    correct: int = Field(ge=0, le=3)  # 0-3
     explanation: QuestionText
     section: LegislationSection
 
@@ -71,7 +95,7 @@ class QuestionCreate(BaseModel):
 class QuestionUpdate(BaseModel):
     question: Optional[QuestionText] = None
     options: Optional[List[QuestionOption]] = None
-    correct: Optional[int] = None
+    correct: Optional[int] = Field(default=None, ge=0, le=3)
     explanation: Optional[QuestionText] = None
     section: Optional[LegislationSection] = None
 
@@ -119,18 +143,34 @@ class ExamHistoryResponse(BaseModel):
     overall_statistics: Dict[str, Dict[str, int]]  # {section: {"correct": X, "total": Y}}
 
 
+class ExamSummary(BaseModel):
+    """Краткие данные экзамена для страницы деталей"""
+    id: str
+    mode: TestMode
+    score: float
+    correct_answers: int
+    total_questions: int
+    passed: bool
+    time_spent: Optional[int] = None
+    created_at: datetime
+
+
+class ExamQuestionResult(QuestionResponse):
+    """Вопрос экзамена вместе с ответом пользователя"""
+    user_answer: int  # -1, если ответа нет
+    is_correct: bool
+
+
+class ExamDetailsResponse(BaseModel):
+    exam: ExamSummary
+    questions: List[ExamQuestionResult]
+
+
 # Модели для Report
 class ReportCreate(BaseModel):
     text: str
 
 
-# Модели для фильтров
-class QuestionFilter(BaseModel):
-    section: Optional[LegislationSection] = None
-    lang: str = "kz"
-    limit: Optional[int] = None
-
-
 # Модели для админки
 class AdminQuestion(BaseModel):
     """Модель вопроса для админки (с kz/ru полями)"""
@@ -150,10 +190,24 @@ class PaginatedResponse(BaseModel):
     page: int
     page_size: int
     total_pages: int
+    next_cursor: Optional[str] = None  # id последнего вопроса страницы для следующего запроса
+
+    @classmethod
+    def build(cls, items: List[AdminQuestion], total: int, page: int, page_size: int,
+              next_cursor: Optional[str] = None) -> "PaginatedResponse":
+        """Собирает ответ, считая количество страниц целочисленным делением с округлением вверх"""
+        return cls(
+            items=items,
+            total=total,
+            page=page,
+            page_size=page_size,
+            total_pages=max(1, -(-total // page_size)),
+            next_cursor=next_cursor
+        )
 
 
 # Названия разделов
-LEGISLATION_NAMES = {
+_LEGISLATION_NAMES = {
     LegislationSection.CIVIL_CODE: {
         "kz": "Азаматтық кодекс",
         "ru": "Гражданский кодекс"
@@ -192,3 +246,14 @@ LEGISLATION_NAMES = {
     }
 }
 
+
+# Справочники модуля доступны только для чтения: случайная запись
+# в них из любого места кода вызовет ошибку, а не изменит данные
+LEGISLATION_NAMES = MappingProxyType({
+    section: MappingProxyType(names) for section, names in _LEGISLATION_NAMES.items()
+})
+
+# Те же названия с ключом-строкой раздела (как он хранится в Firebase)
+LEGISLATION_NAMES_BY_VALUE = MappingProxyType({
+    section.value: names for section, names in LEGISLATION_NAMES.items()
+})